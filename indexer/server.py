@@ -1,22 +1,134 @@
+import asyncio
 import logging
 import argparse
+import sys
+import tempfile
+from contextlib import asynccontextmanager
 from typing import List, Dict, Any, Union
 import json
-from flask import Flask, request, jsonify
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+# Server-side batching: pending requests are coalesced into one forward
+# pass of up to BATCH_MAX texts; BATCH_WAIT is how long the batcher waits
+# for more requests before running a partial batch.
+BATCH_MAX = 64
+BATCH_WAIT = 0.005
+
 model = None
+request_q: asyncio.Queue = None
+
+async def _batcher():
+    """Single consumer: drains the queue and runs batched encodes.
+
+    One task keeps the model hot; concurrent clients share forward passes
+    instead of serializing on per-request encodes.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await request_q.get()]
+        total = len(batch[0][0])
+        while total < BATCH_MAX:
+            try:
+                item = await asyncio.wait_for(request_q.get(), BATCH_WAIT)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            total += len(item[0])
+
+        texts = [t for req_texts, _ in batch for t in req_texts]
+        try:
+            # encode releases the loop via the default thread executor
+            embeddings = await loop.run_in_executor(
+                None, lambda: model.encode(texts, batch_size=BATCH_MAX, convert_to_numpy=True).tolist())
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+
+        offset = 0
+        for req_texts, fut in batch:
+            if not fut.done():
+                fut.set_result(embeddings[offset:offset + len(req_texts)])
+            offset += len(req_texts)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global request_q
+    request_q = asyncio.Queue()
+    batcher = asyncio.create_task(_batcher())
+    yield
+    batcher.cancel()
+
+app = FastAPI(lifespan=lifespan)
+
+class OnnxEncoder:
+    """Runs the embedding model through ONNX Runtime (dynamic INT8 when possible).
+
+    Exposes the same encode() call the handler uses for SentenceTransformer,
+    with mean pooling and L2 normalization done in NumPy to match the
+    sentence-transformers pipeline for MiniLM-class models.
+    """
+    def __init__(self, model_name_or_path: str):
+        import numpy as np
+        from transformers import AutoTokenizer
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+
+        self.np = np
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+        ort_model = ORTModelForFeatureExtraction.from_pretrained(model_name_or_path, export=True)
+
+        # Dynamic INT8 quantization: typically 3-4x on CPU for MiniLM-class
+        # models. Keep the FP32 export if quantization fails.
+        try:
+            from optimum.onnxruntime import ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+            save_dir = tempfile.mkdtemp(prefix="onnx-int8-")
+            quantizer = ORTQuantizer.from_pretrained(ort_model)
+            quantizer.quantize(save_directory=save_dir,
+                               quantization_config=AutoQuantizationConfig.avx2(is_static=False))
+            ort_model = ORTModelForFeatureExtraction.from_pretrained(save_dir)
+            logger.info("Using INT8-quantized ONNX model.")
+        except Exception as e:
+            logger.warning(f"INT8 quantization unavailable ({e}); using FP32 ONNX model.")
+
+        self.model = ort_model
+
+    def encode(self, texts: List[str], **kwargs):
+        np = self.np
+        inputs = self.tokenizer(texts, padding=True, truncation=True, return_tensors="np")
+        hidden = self.model(**inputs).last_hidden_state
+        # Mean pooling over non-padding tokens, then L2 normalize
+        mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-9, None)
 
 def load_model(model_name_or_path: str):
     global model
+    try:
+        model = OnnxEncoder(model_name_or_path)
+        logger.info("Model loaded successfully (ONNX Runtime backend).")
+        return
+    except ImportError:
+        logger.info("optimum/onnxruntime not installed; falling back to sentence-transformers.")
+    except Exception as e:
+        logger.warning(f"ONNX backend failed ({e}); falling back to sentence-transformers.")
+
     try:
         from sentence_transformers import SentenceTransformer
-        logger.info(f"Loading SentenceTransformer model: {model_name_or_path}...")
-        model = SentenceTransformer(model_name_or_path)
+        import torch
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        logger.info(f"Loading SentenceTransformer model: {model_name_or_path} on {device}...")
+        model = SentenceTransformer(model_name_or_path, device=device)
+        if device == 'cuda':
+            # FP16 halves memory bandwidth on tensor-core GPUs; the numpy
+            # conversion on encode() casts back up for JSON output
+            model = model.half()
         logger.info("Model loaded successfully.")
     except ImportError:
         logger.error("sentence-transformers not installed. Please run: pip install sentence-transformers")
@@ -25,56 +137,56 @@ def load_model(model_name_or_path: str):
         logger.error(f"Failed to load model: {e}")
         sys.exit(1)
 
-@app.route('/v1/embeddings', methods=['POST'])
-def embeddings():
+@app.post('/v1/embeddings')
+async def embeddings(request: Request):
     if not model:
-        return jsonify({"error": "Model not loaded"}), 500
+        return JSONResponse({"error": "Model not loaded"}, status_code=500)
 
-    data = request.json
+    data = await request.json()
     if not data or 'input' not in data:
-        return jsonify({"error": "Missing 'input' field"}), 400
+        return JSONResponse({"error": "Missing 'input' field"}, status_code=400)
 
     text_input = data['input']
     if isinstance(text_input, str):
         text_input = [text_input]
 
+    # Hand the texts to the batcher and await our slice of the batch
+    fut = asyncio.get_running_loop().create_future()
+    await request_q.put((text_input, fut))
     try:
-        # Generate embeddings
-        # convert_to_numpy=False returns valid python lists if using older versions, 
-        # but modern sentence-transformers returns tensors or ndarrays.
-        # tolist() ensures JSON serializability.
-        embeddings = model.encode(text_input, convert_to_numpy=True).tolist()
-        
-        # Format response to match OpenAI API
-        data_response = []
-        for i, emb in enumerate(embeddings):
-            data_response.append({
-                "object": "embedding",
-                "index": i,
-                "embedding": emb
-            })
-            
-        return jsonify({
-            "object": "list",
-            "data": data_response,
-            "model": "local-sentence-transformer",
-            "usage": {
-                "prompt_tokens": 0,
-                "total_tokens": 0
-            }
-        })
+        embeddings = await fut
     except Exception as e:
         logger.error(f"Error generating embedding: {e}")
-        return jsonify({"error": str(e)}), 500
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    # Format response to match OpenAI API
+    data_response = []
+    for i, emb in enumerate(embeddings):
+        data_response.append({
+            "object": "embedding",
+            "index": i,
+            "embedding": emb
+        })
+
+    return {
+        "object": "list",
+        "data": data_response,
+        "model": "local-sentence-transformer",
+        "usage": {
+            "prompt_tokens": 0,
+            "total_tokens": 0
+        }
+    }
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Local Embedding Server")
     parser.add_argument("--port", type=int, default=5001, help="Port to run server on")
     parser.add_argument("--model", type=str, default="all-MiniLM-L6-v2", help="SentenceTransformer model name")
     args = parser.parse_args()
-    
-    import sys
+
     load_model(args.model)
-    
+
+    import uvicorn
     logger.info(f"Starting server on port {args.port}...")
-    app.run(host="0.0.0.0", port=args.port)
+    # One worker keeps the model hot; the batcher gives throughput
+    uvicorn.run(app, host="0.0.0.0", port=args.port)